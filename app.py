@@ -1,14 +1,23 @@
+import hashlib
 import io
-import json
 import os
+import re
 import textwrap
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, date
 from decimal import Decimal
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import orjson
 import requests
-from flask import Flask, jsonify, request, send_from_directory, has_request_context
+from requests.adapters import HTTPAdapter
+from flask import Flask, g, has_app_context, has_request_context, jsonify, request, send_from_directory, stream_with_context
+from flask.json.provider import JSONProvider
+from flask_caching import Cache
 from flask_cors import CORS
 import mysql.connector
 from mysql.connector import pooling, errorcode
@@ -25,36 +34,58 @@ from zoneinfo import ZoneInfo
 class Database:
     def __init__(self) -> None:
         self.pool: Optional[pooling.MySQLConnectionPool] = None
+        self.acquire_timeout = 0.0
 
     def init_app(self, app: Flask) -> None:
         config = {
             "pool_name": "servicemate_pool",
-            "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "32")),
+            "pool_reset_session": os.getenv("DB_POOL_RESET", "0") == "1",
             "host": os.getenv("DB_HOST", "localhost"),
             "port": int(os.getenv("DB_PORT", "3306")),
             "user": os.getenv("DB_USER", "mkelqfjv_bsma"),
             "password": os.getenv("DB_PASSWORD", "mkelqfjv_bsma"),
-            "database": os.getenv("DB_NAME", "mkelqfjv_bsma"),
+            "database": DB_NAME,
             "charset": "utf8mb4",
             "collation": "utf8mb4_unicode_ci",
+            "autocommit": True,
+            "use_pure": os.getenv("DB_USE_PURE", "0") == "1" or not mysql.connector.HAVE_CEXT,
         }
 
+        self.acquire_timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
         try:
             self.pool = pooling.MySQLConnectionPool(**config)
         except mysql.connector.Error as exc:
             app.logger.error("Failed to initialise DB pool: %s", exc)
             raise
 
+        # Keep DB_POOL_SIZE * workers below the server's max_connections.
+        app.logger.info(
+            "DB pool ready: size=%s reset_session=%s c_extension=%s",
+            config["pool_size"],
+            config["pool_reset_session"],
+            not config["use_pure"],
+        )
+
     def get_connection(self):
         if not self.pool:
             raise RuntimeError("Database pool not initialised")
-        return self.pool.get_connection()
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            try:
+                return self.pool.get_connection()
+            except pooling.PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.01)
 
 
 db = Database()
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DB_NAME = os.getenv("DB_NAME", "mkelqfjv_bsma")
 INVOICE_PDF_DIR = os.getenv("INVOICE_PDF_DIR", os.path.join(BASE_DIR, "static", "invoices"))
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", os.path.join(BASE_DIR, "static", "cache")))
 NEIGHSHOP_LOGO_PATH = Path(BASE_DIR) / "logo.png"
 NEIGHSHOP_LOGO_URL = os.getenv(
     "NEIGHSHOP_LOGO_URL",
@@ -64,18 +95,51 @@ SERVICEMATE_LOGO_URL = os.getenv(
     "SERVICEMATE_LOGO_URL",
     "https://github.com/AKM-dv/servicemate/blob/main/Group%2064.png?raw=true",
 )
+UPI_QR_URL = os.getenv(
+    "UPI_QR_URL",
+    "https://github.com/AKM-dv/servicemate/blob/main/WhatsApp%20Image%202025-11-07%20at%2001.24.34.jpeg?raw=true",
+)
 DEFAULT_CONTACT_NUMBER = os.getenv("CONTACT_PHONE", "+91 8307802643")
 DEFAULT_UPI_ID = os.getenv("UPI_ID", "8307802643@axl")
 DEFAULT_BANK_NAME = os.getenv("BANK_NAME", "Suman Kumari")
 DEFAULT_BANK_ACCOUNT = os.getenv("BANK_ACCOUNT", "STATE BANK OF INDIA")
 DEFAULT_ACCOUNT_NUMBER = os.getenv("BANK_ACCOUNT_NO", "42213259870")
 DEFAULT_UPI_LABEL = os.getenv("UPI_LABEL", DEFAULT_UPI_ID)
-DEFAULT_SETUP_FEE = Decimal(os.getenv("SETUP_FEE_AMOUNT", "3000"))
+CENTS = Decimal("0.01")
+DEFAULT_SETUP_FEE = Decimal(os.getenv("SETUP_FEE_AMOUNT", "3000")).quantize(CENTS)
 IST = ZoneInfo(os.getenv("TIMEZONE", "Asia/Kolkata"))
-FEEDBACK_CATEGORIES = {"Bug", "Suggestion", "Improvement", "Other"}
-FEEDBACK_STATUSES = {"Open", "In Review", "Resolved"}
+IST_OFFSET = datetime(datetime.now(IST).year, 1, 1, tzinfo=IST).isoformat()[-6:]
+if datetime(datetime.now(IST).year, 7, 1, tzinfo=IST).isoformat()[-6:] != IST_OFFSET:
+    raise RuntimeError("TIMEZONE must have a fixed UTC offset; list endpoints format timestamps in SQL")
+FEEDBACK_CATEGORIES = frozenset({"Bug", "Suggestion", "Improvement", "Other"})
+FEEDBACK_STATUSES = frozenset({"Open", "In Review", "Resolved"})
 PIN_LENGTH = 6
-LOGO_CACHE: Dict[str, Optional[ImageReader]] = {}
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+SEARCH_MIN_LENGTH = 2
+FULLTEXT_MIN_TOKEN = int(os.getenv("FULLTEXT_MIN_TOKEN", "3"))
+FULLTEXT_STOPWORDS = frozenset(
+    "a about an are as at be by com de en for from how i in is it la of on or "
+    "that the this to was what when where who will with und www".split()
+)
+JSON_STREAM_BATCH = int(os.getenv("JSON_STREAM_BATCH", "500"))
+PLANS_CACHE_TIMEOUT = int(os.getenv("PLANS_CACHE_TIMEOUT", "300"))
+INVOICE_LOOKUP_CACHE_TIMEOUT = int(os.getenv("INVOICE_LOOKUP_CACHE_TIMEOUT", "60"))
+ANALYTICS_CACHE_KEY = "analytics_summary_v1"
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_TIMEOUT", "30"))
+ADMIN_PIN_CACHE: Dict[str, Any] = {}
+PLANS_SNAPSHOT: Tuple[float, Dict[int, Dict[str, Any]]] = (0.0, {})
+PLANS_LOCK = threading.Lock()
+LOGO_CACHE: Dict[str, Any] = {}
+LOGO_LOCK = threading.Lock()
+LOGO_RETRY_SECONDS = int(os.getenv("LOGO_RETRY_SECONDS", "300"))
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+PDF_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("PDF_WORKERS", "4")), thread_name_prefix="invoice-pdf")
+PDF_JOBS: Dict[str, Future] = {}
+PDF_JOB_TIMEOUT = int(os.getenv("PDF_JOB_TIMEOUT", "60"))
+
+
+format_amount = "{:,.2f}".format
 
 
 def as_decimal(value: Any) -> Decimal:
@@ -83,56 +147,114 @@ def as_decimal(value: Any) -> Decimal:
         return value
     if value is None:
         return Decimal("0")
+    if isinstance(value, int):
+        return Decimal(value)
     return Decimal(str(value))
 
 
-def dict_factory(cursor, row) -> Dict[str, Any]:
-    return {desc[0]: row[idx] for idx, desc in enumerate(cursor.description)}
+def acquire_connection() -> Tuple[Any, bool]:
+    if has_app_context():
+        if "_db_conn" not in g:
+            g._db_conn = db.get_connection()
+        return g._db_conn, False
+    return db.get_connection(), True
 
 
-def execute(query: str, params: Optional[tuple] = None, *, fetchone: bool = False, fetchall: bool = False) -> Any:
-    conn = db.get_connection()
+def release_connection(exc: Optional[BaseException] = None) -> None:
+    conn = g.pop("_db_conn", None)
+    if conn is None:
+        return
     try:
-        cursor = conn.cursor()
-        cursor.execute(query, params or ())
-        if fetchone:
-            result = cursor.fetchone()
-        elif fetchall:
-            result = cursor.fetchall()
-        else:
-            result = None
-        conn.commit()
-        return result
+        if conn.in_transaction:
+            if exc is None:
+                conn.commit()
+            else:
+                conn.rollback()
     finally:
         conn.close()
 
 
-def execute_dict(query: str, params: Optional[tuple] = None, *, fetchone: bool = False, fetchall: bool = False) -> Any:
-    conn = db.get_connection()
+@contextmanager
+def db_cursor(dictionary: bool = False) -> Iterator[Any]:
+    conn, owned = acquire_connection()
     try:
-        cursor = conn.cursor()
+        yield conn.cursor(buffered=True, dictionary=dictionary)
+    finally:
+        if owned:
+            conn.close()
+
+
+def execute(query: str, params: Optional[tuple] = None, *, fetchone: bool = False, fetchall: bool = False) -> Any:
+    with db_cursor() as cursor:
         cursor.execute(query, params or ())
-        columns = [col[0] for col in cursor.description]
         if fetchone:
-            row = cursor.fetchone()
-            result = dict(zip(columns, row)) if row else None
-        elif fetchall:
-            result = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        else:
-            result = None
-        conn.commit()
-        return result
+            return cursor.fetchone()
+        if fetchall:
+            return cursor.fetchall()
+        return cursor.lastrowid
+
+
+def execute_dict(query: str, params: Optional[tuple] = None, *, fetchone: bool = False, fetchall: bool = False) -> Any:
+    with db_cursor(dictionary=True) as cursor:
+        cursor.execute(query, params or ())
+        if fetchone:
+            return cursor.fetchone()
+        if fetchall:
+            return cursor.fetchall()
+        return None
+
+
+def execute_dict_multi(query: str, params: Optional[tuple] = None) -> List[List[Dict[str, Any]]]:
+    with db_cursor(dictionary=True) as cursor:
+        return [result.fetchall() for result in cursor.execute(query, params or (), multi=True) if result.with_rows]
+
+
+def stream_dict_rows(query: str, params: tuple = ()) -> Iterator[Dict[str, Any]]:
+    rows = iterate_dict_rows(query, params)
+    next(rows)
+    return rows
+
+
+def iterate_dict_rows(query: str, params: tuple) -> Iterator[Any]:
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(JSON_STREAM_BATCH)
+        yield None
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany(JSON_STREAM_BATCH)
     finally:
-        conn.close()
+        try:
+            if conn.unread_result:
+                conn.consume_results()
+        finally:
+            conn.close()
 
 
-def column_exists(table: str, column: str) -> bool:
-    result = execute(
-        f"SHOW COLUMNS FROM {table} LIKE %s",
-        (column,),
-        fetchone=True,
+def execute_many_ddl(statements: List[str]) -> None:
+    with db_cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def load_schema_columns() -> Set[Tuple[str, str]]:
+    rows = execute(
+        "SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s",
+        (DB_NAME,),
+        fetchall=True,
+    )
+    return {(table, column) for table, column in rows or []}
+
+
+def load_schema_indexes() -> Set[Tuple[str, str]]:
+    rows = execute(
+        "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS WHERE TABLE_SCHEMA = %s",
+        (DB_NAME,),
+        fetchall=True,
     )
-    return bool(result)
+    return {(table, index) for table, index in rows or []}
 
 
 def initialize_schema(app: Flask) -> None:
@@ -232,6 +354,12 @@ def initialize_schema(app: Flask) -> None:
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """,
         """
+        CREATE TABLE IF NOT EXISTS invoice_sequences (
+            period CHAR(6) PRIMARY KEY,
+            seq INT NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """,
+        """
         CREATE TABLE IF NOT EXISTS admin_feedback (
             id INT AUTO_INCREMENT PRIMARY KEY,
             title VARCHAR(191) NOT NULL,
@@ -244,22 +372,37 @@ def initialize_schema(app: Flask) -> None:
         """
     ]
 
-    for statement in statements:
-        execute(statement)
+    execute_many_ddl(statements)
 
-    ensure_lead_phone_column()
+    columns = load_schema_columns()
+    ensure_lead_phone_column(columns)
     ensure_lead_optional_columns()
-    ensure_user_pin_column()
+    ensure_user_pin_column(columns)
     ensure_lead_status_enum()
-    ensure_followup_columns()
+    ensure_followup_columns(columns)
     ensure_followup_status_enum()
-    ensure_invoice_columns()
+    ensure_invoice_columns(columns)
+    ensure_indexes(load_schema_indexes())
+    seed_invoice_sequences()
 
     seed_admin(app)
     ensure_admin_pin()
     seed_plans()
 
 
+def seed_invoice_sequences() -> None:
+    execute(
+        """
+        INSERT INTO invoice_sequences (period, seq)
+        SELECT SUBSTRING(invoice_number, 4, 6), MAX(CAST(SUBSTRING(invoice_number, 10) AS UNSIGNED))
+        FROM invoices
+        WHERE invoice_number LIKE 'INV%' AND NOT EXISTS (SELECT 1 FROM invoice_sequences)
+        GROUP BY SUBSTRING(invoice_number, 4, 6)
+        ON DUPLICATE KEY UPDATE seq = GREATEST(seq, VALUES(seq))
+        """
+    )
+
+
 def seed_admin(app: Flask) -> None:
     admin_email = os.getenv("ADMIN_EMAIL", "admin@servicemate.com")
     existing = execute("SELECT id FROM users WHERE email = %s", (admin_email,), fetchone=True)
@@ -281,6 +424,40 @@ def seed_admin(app: Flask) -> None:
     app.logger.info("Seeded default admin user")
 
 
+def get_plans(refresh: bool = False) -> Dict[int, Dict[str, Any]]:
+    global PLANS_SNAPSHOT
+    expires, plans = PLANS_SNAPSHOT
+    if not refresh and expires > time.monotonic():
+        return plans
+    with PLANS_LOCK:
+        expires, plans = PLANS_SNAPSHOT
+        if refresh or expires <= time.monotonic():
+            rows = execute_dict("SELECT id, name, price, features, is_active, sort_order FROM plans", fetchall=True)
+            plans = {row["id"]: row for row in rows}
+            PLANS_SNAPSHOT = (time.monotonic() + PLANS_CACHE_TIMEOUT, plans)
+        return plans
+
+
+def invalidate_plans() -> None:
+    global PLANS_SNAPSHOT
+    with PLANS_LOCK:
+        PLANS_SNAPSHOT = (0.0, {})
+
+
+def activate_plan(cursor: Any, plan_id: int, name: str, price: Decimal, features: List[str]) -> None:
+    cursor.execute(
+        """
+        UPDATE plans
+        SET name = IF(id = %(id)s, %(name)s, name),
+            price = IF(id = %(id)s, %(price)s, price),
+            features = IF(id = %(id)s, %(features)s, features),
+            sort_order = IF(id = %(id)s, 1, sort_order),
+            is_active = (id = %(id)s)
+        """,
+        {"id": plan_id, "name": name, "price": price, "features": json_dumps(features)},
+    )
+
+
 def seed_plans() -> None:
     basic_features = [
         "Website",
@@ -291,33 +468,28 @@ def seed_plans() -> None:
     ]
     basic_price = Decimal("1999.00")
 
-    plans = execute_dict("SELECT id, name FROM plans", fetchall=True)
-    basic_plan = next((plan for plan in plans if plan["name"].lower() == "basic"), None) if plans else None
-
-    if basic_plan:
-        execute(
-            "UPDATE plans SET price=%s, features=%s, is_active=1, sort_order=1 WHERE id=%s",
-            (
-                basic_price,
-                json_dumps(basic_features),
-                basic_plan["id"],
-            ),
-        )
-        execute("UPDATE plans SET is_active = 0 WHERE id <> %s", (basic_plan["id"],))
-    else:
-        execute("DELETE FROM plans")
-        execute(
-            "INSERT INTO plans (name, price, features, is_active, sort_order) VALUES (%s, %s, %s, 1, 1)",
-            (
-                "Basic",
-                basic_price,
-                json_dumps(basic_features),
-            ),
-        )
-
+    with db_cursor(dictionary=True) as cursor:
+        cursor.execute("SELECT id, name FROM plans")
+        plans = cursor.fetchall()
+        basic_plan = next((plan for plan in plans if plan["name"].lower() == "basic"), None)
 
-def ensure_lead_phone_column() -> None:
-    if column_exists("leads", "phone"):
+        if basic_plan:
+            activate_plan(cursor, basic_plan["id"], basic_plan["name"], basic_price, basic_features)
+        else:
+            cursor.execute("DELETE FROM plans")
+            cursor.execute(
+                "INSERT INTO plans (name, price, features, is_active, sort_order) VALUES (%s, %s, %s, 1, 1)",
+                (
+                    "Basic",
+                    basic_price,
+                    json_dumps(basic_features),
+                ),
+            )
+    invalidate_plans()
+
+
+def ensure_lead_phone_column(columns: Set[Tuple[str, str]]) -> None:
+    if ("leads", "phone") in columns:
         return
     try:
         execute("ALTER TABLE leads ADD COLUMN phone VARCHAR(20) DEFAULT NULL")
@@ -340,8 +512,8 @@ def ensure_lead_optional_columns() -> None:
     )
 
 
-def ensure_user_pin_column() -> None:
-    if not column_exists("users", "pin_hash"):
+def ensure_user_pin_column(columns: Set[Tuple[str, str]]) -> None:
+    if ("users", "pin_hash") not in columns:
         execute(
             """
             ALTER TABLE users ADD COLUMN pin_hash VARCHAR(255) DEFAULT NULL
@@ -358,7 +530,7 @@ def ensure_lead_status_enum() -> None:
     )
 
 
-def ensure_followup_columns() -> None:
+def ensure_followup_columns(columns: Set[Tuple[str, str]]) -> None:
     definitions = {
         "follow_up_date": "ADD COLUMN follow_up_date DATE",
         "objective": "ADD COLUMN objective VARCHAR(255) DEFAULT NULL",
@@ -366,7 +538,7 @@ def ensure_followup_columns() -> None:
     }
 
     for column, ddl in definitions.items():
-        if not column_exists("lead_followups", column):
+        if ("lead_followups", column) not in columns:
             execute(f"ALTER TABLE lead_followups {ddl}")
 
 
@@ -379,7 +551,7 @@ def ensure_followup_status_enum() -> None:
     )
 
 
-def ensure_invoice_columns() -> None:
+def ensure_invoice_columns(columns: Set[Tuple[str, str]]) -> None:
     definitions = {
         "setup_fee_amount": "ADD COLUMN setup_fee_amount DECIMAL(10,2) NOT NULL DEFAULT 3000.00",
         "setup_fee_discount": "ADD COLUMN setup_fee_discount DECIMAL(10,2) NOT NULL DEFAULT 0.00",
@@ -387,12 +559,32 @@ def ensure_invoice_columns() -> None:
     }
 
     for column, ddl in definitions.items():
-        if not column_exists("invoices", column):
+        if ("invoices", column) not in columns:
             execute(f"ALTER TABLE invoices {ddl}")
 
 
+def ensure_indexes(indexes: Set[Tuple[str, str]]) -> None:
+    definitions = {
+        ("invoices", "idx_invoices_lead_generated"): "CREATE INDEX idx_invoices_lead_generated ON invoices (lead_id, generated_at DESC)",
+        ("lead_followups", "idx_followups_lead_created"): "CREATE INDEX idx_followups_lead_created ON lead_followups (lead_id, created_at DESC)",
+        ("leads", "idx_leads_status_created"): "CREATE INDEX idx_leads_status_created ON leads (status, created_at DESC)",
+        ("leads", "idx_leads_plan_status"): "CREATE INDEX idx_leads_plan_status ON leads (preferred_plan_id, status)",
+        ("lead_payments", "idx_payments_paid"): "CREATE INDEX idx_payments_paid ON lead_payments (paid_on, billing_month)",
+        ("leads", "ft_leads_search"): "ALTER TABLE leads ADD FULLTEXT INDEX ft_leads_search (name, email, phone, brand_name)",
+    }
+
+    for key, ddl in definitions.items():
+        if key in indexes:
+            continue
+        try:
+            execute(ddl)
+        except mysql.connector.Error as exc:  # type: ignore[attr-defined]
+            if getattr(exc, "errno", None) != errorcode.ER_DUP_KEYNAME:
+                raise
+
+
 def json_dumps(data: Any) -> str:
-    return json.dumps(data, default=str)
+    return orjson.dumps(data, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
 
 
 def json_loads(raw: Any) -> Any:
@@ -401,20 +593,75 @@ def json_loads(raw: Any) -> Any:
     if isinstance(raw, (dict, list)):
         return raw
     try:
-        return json.loads(raw)
+        return orjson.loads(raw)
     except (TypeError, ValueError):
         return raw
 
 
-def parse_decimal(value: Any) -> float:
-    return float(as_decimal(value))
+def json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return to_ist_datetime(value).isoformat()
+    return str(value)
+
+
+class OrjsonProvider(JSONProvider):
+    option = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=json_default, option=self.option).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=json_default, option=self.option),
+            mimetype="application/json",
+        )
+
+    def stream(self, rows: Iterable[Any]):
+        def generate() -> Iterator[bytes]:
+            separator = b"["
+            batch: List[bytes] = []
+            for row in rows:
+                batch.append(orjson.dumps(row, default=json_default, option=self.option))
+                if len(batch) >= JSON_STREAM_BATCH:
+                    yield separator + b",".join(batch)
+                    separator = b","
+                    batch = []
+            if batch:
+                yield separator + b",".join(batch)
+                separator = b","
+            yield b"[]" if separator == b"[" else b"]"
+
+        response = self._app.response_class(stream_with_context(generate()), mimetype="application/json")
+        if hasattr(rows, "close"):
+            response.call_on_close(rows.close)
+        return response
 
 
 def sanitize_string(value: Any) -> Optional[str]:
+    if isinstance(value, str):
+        return value.strip() or None
     if value is None:
         return None
-    result = str(value).strip()
-    return result or None
+    return str(value).strip() or None
+
+
+def parse_id(value: Any) -> Optional[int]:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+def fulltext_terms(search: str) -> Optional[str]:
+    tokens = [token for token in SEARCH_TOKEN_RE.findall(search.lower()) if token not in FULLTEXT_STOPWORDS]
+    if not tokens or any(len(token) < FULLTEXT_MIN_TOKEN for token in tokens):
+        return None
+    return " ".join(f"+{token}*" for token in tokens)
 
 
 def ensure_invoice_pdf_dir() -> None:
@@ -432,6 +679,39 @@ def wrap_text(text: Optional[str], width: int = 70) -> List[str]:
     return textwrap.wrap(text, width) or ["NA"]
 
 
+INVOICE_PRIMARY_COLOR = colors.HexColor("#0F172A")
+INVOICE_DIVIDER_COLOR = colors.HexColor("#CBD5F5")
+INVOICE_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), INVOICE_PRIMARY_COLOR),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 11),
+        ("ALIGN", (0, 0), (-1, 0), "LEFT"),
+        ("ALIGN", (0, 1), (-1, -1), "RIGHT"),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), 10),
+        ("LINEABOVE", (0, 1), (-1, -1), 0.25, INVOICE_DIVIDER_COLOR),
+        ("LINEBELOW", (0, -1), (-1, -1), 0.8, INVOICE_PRIMARY_COLOR),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
+    ]
+)
+INVOICE_PAYMENT_LINES = tuple(
+    line.strip() for line in os.getenv("INVOICE_PAYMENT_LINES", "").split("|") if line.strip()
+) or (
+    f"Bank Name: {DEFAULT_BANK_ACCOUNT}",
+    f"Account Holder: {DEFAULT_BANK_NAME}",
+    f"Account Number: {DEFAULT_ACCOUNT_NUMBER}",
+    f"UPI: {DEFAULT_UPI_LABEL}",
+)
+COMPANY_ADDRESS_LINES = tuple(
+    wrap_text(
+        "Shri Ram Nagar, 8-B, opp. Dhanwantri Hospital & Research Centre, near New Sanganer Road, Mansarovar, Jaipur, Rajasthan 302020",
+        width=80,
+    )
+) + ("+91 8307802643",)
+
+
 def absolute_invoice_url(path: Optional[str]) -> Optional[str]:
     if not path:
         return None
@@ -443,37 +723,89 @@ def absolute_invoice_url(path: Optional[str]) -> Optional[str]:
     return path
 
 
-def get_logo_image(url: Optional[str]) -> Optional[ImageReader]:
-    if url == "local_neighshop" and NEIGHSHOP_LOGO_PATH.exists():
-        cache_key = str(NEIGHSHOP_LOGO_PATH.resolve())
-        cached = LOGO_CACHE.get(cache_key)
-        if cached is not None:
-            return cached
+def sql_iso_datetime(column: str, alias: str) -> str:
+    return f"DATE_FORMAT({column}, '%Y-%m-%dT%H:%i:%S{IST_OFFSET}') AS {alias}"
+
+
+def sql_invoice_url(column: str, alias: str) -> str:
+    return f"CASE WHEN {column} = '' THEN NULL WHEN {column} REGEXP '^https?://' THEN {column} ELSE CONCAT(%s, {column}) END AS {alias}"
+
+
+def fetch_remote_image(url: str) -> bytes:
+    cache_path = IMAGE_CACHE_DIR / f"{hashlib.sha1(url.encode()).hexdigest()}.bin"
+    if cache_path.exists():
+        return cache_path.read_bytes()
+
+    response = HTTP_SESSION.get(url, timeout=10)
+    response.raise_for_status()
+    IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    temp_path.write_bytes(response.content)
+    temp_path.replace(cache_path)
+    return response.content
+
+
+def neighshop_logo_source() -> str:
+    return "local_neighshop" if NEIGHSHOP_LOGO_PATH.exists() else NEIGHSHOP_LOGO_URL
+
+
+def decode_image(data: bytes) -> Any:
+    reader = ImageReader(io.BytesIO(data))
+    if reader.jpeg_fh() is not None:
+        return data
+    reader.getRGBData()
+    return reader
+
+
+def load_logo_image(url: str) -> Any:
+    if url == "local_neighshop":
         try:
-            with NEIGHSHOP_LOGO_PATH.open("rb") as file_handler:
-                cached = ImageReader(file_handler)
+            return decode_image(NEIGHSHOP_LOGO_PATH.read_bytes())
         except Exception as exc:
             if app.logger:
                 app.logger.warning("Failed to load local logo %s: %s", NEIGHSHOP_LOGO_PATH, exc)
-            cached = None
-        LOGO_CACHE[cache_key] = cached
-        return cached
+            return None
 
-    if not url:
-        return None
-    cached = LOGO_CACHE.get(url)
-    if cached is not None:
-        return cached
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        cached = ImageReader(io.BytesIO(response.content))
+        return decode_image(fetch_remote_image(url))
     except Exception as exc:
         if app.logger:
             app.logger.warning("Failed to load logo %s: %s", url, exc)
-        cached = None
-    LOGO_CACHE[url] = cached
-    return cached
+        return None
+
+
+def cached_logo(cache_key: str) -> Any:
+    entry = LOGO_CACHE.get(cache_key)
+    if isinstance(entry, float) and entry <= time.monotonic():
+        return None
+    return entry
+
+
+def get_logo_image(url: Optional[str]) -> Optional[ImageReader]:
+    if url == "local_neighshop" and NEIGHSHOP_LOGO_PATH.exists():
+        cache_key = str(NEIGHSHOP_LOGO_PATH.resolve())
+    elif url and url != "local_neighshop":
+        cache_key = url
+    else:
+        return None
+
+    entry = cached_logo(cache_key)
+    if entry is None:
+        with LOGO_LOCK:
+            entry = cached_logo(cache_key)
+            if entry is None:
+                entry = load_logo_image(url)
+                if entry is None:
+                    entry = time.monotonic() + LOGO_RETRY_SECONDS
+                LOGO_CACHE[cache_key] = entry
+    if isinstance(entry, bytes):
+        return ImageReader(io.BytesIO(entry))
+    return entry if isinstance(entry, ImageReader) else None
+
+
+def init_logos() -> None:
+    for url in (neighshop_logo_source(), UPI_QR_URL):
+        get_logo_image(url)
 
 
 def to_ist_datetime(value: Any) -> Optional[datetime]:
@@ -483,17 +815,17 @@ def to_ist_datetime(value: Any) -> Optional[datetime]:
         dt_value = value
     else:
         raw = str(value)
-        dt_value = None
-        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f"):
-            try:
-                dt_value = datetime.strptime(raw, fmt)
-                break
-            except ValueError:
-                continue
-        if dt_value is None:
-            try:
-                dt_value = datetime.fromisoformat(raw.replace("Z", "+00:00"))
-            except ValueError:
+        try:
+            dt_value = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        except ValueError:
+            dt_value = None
+            for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f"):
+                try:
+                    dt_value = datetime.strptime(raw, fmt)
+                    break
+                except ValueError:
+                    continue
+            if dt_value is None:
                 return None
     if dt_value.tzinfo is None:
         dt_value = dt_value.replace(tzinfo=IST)
@@ -502,37 +834,8 @@ def to_ist_datetime(value: Any) -> Optional[datetime]:
     return dt_value
 
 
-def fetch_invoice_details(invoice_number: str) -> Optional[Dict[str, Any]]:
-    return execute_dict(
-        """
-        SELECT i.*, l.name AS lead_name, l.email AS lead_email, l.phone AS lead_phone,
-               l.address AS lead_address, l.brand_name AS brand_name,
-               p.name AS plan_name, p.price AS plan_price
-        FROM invoices i
-        JOIN leads l ON l.id = i.lead_id
-        JOIN plans p ON p.id = i.plan_id
-        WHERE i.invoice_number = %s
-        """,
-        (invoice_number,),
-        fetchone=True,
-    )
-
-
 def serialize_invoice_record(invoice: Dict[str, Any]) -> Dict[str, Any]:
     record = dict(invoice)
-    numeric_fields = [
-        "subtotal",
-        "tax",
-        "total",
-        "setup_fee_amount",
-        "setup_fee_discount",
-        "setup_fee_net",
-        "plan_price",
-    ]
-    for field in numeric_fields:
-        if field in record:
-            record[field] = parse_decimal(record[field])
-
     generated_dt = to_ist_datetime(record.get("generated_at"))
     record["generated_at"] = generated_dt.isoformat() if generated_dt else None
 
@@ -543,24 +846,38 @@ def serialize_invoice_record(invoice: Dict[str, Any]) -> Dict[str, Any]:
     record["updated_at"] = updated_dt.isoformat() if updated_dt else None
 
     record["pdf_url"] = absolute_invoice_url(record.get("pdf_url"))
-
     return record
 
 
+def invoice_pdf_filename(invoice: Dict[str, Any]) -> str:
+    return f"{invoice['invoice_number']}.pdf"
+
+
 def generate_invoice_pdf(invoice: Dict[str, Any]) -> str:
     storage_path = Path(INVOICE_PDF_DIR)
     storage_path.mkdir(parents=True, exist_ok=True)
 
-    generated_dt = to_ist_datetime(invoice.get("generated_at")) or datetime.now(IST)
-    timestamp_str = generated_dt.strftime("%Y%m%dT%H%M%S")
-    pdf_filename = f"INV_{timestamp_str}_{invoice.get('lead_id')}.pdf"
+    pdf_filename = invoice_pdf_filename(invoice)
     pdf_path = storage_path / pdf_filename
+    temp_path = pdf_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+    try:
+        draw_invoice_pdf(invoice, str(temp_path))
+        temp_path.replace(pdf_path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    return f"/files/invoices/{pdf_filename}"
+
 
-    pdf_canvas = canvas.Canvas(str(pdf_path), pagesize=A4)
+def draw_invoice_pdf(invoice: Dict[str, Any], target: str) -> None:
+    generated_dt = to_ist_datetime(invoice.get("generated_at")) or datetime.now(IST)
+    pdf_canvas = canvas.Canvas(target, pagesize=A4)
     width, height = A4
     margin = 20 * mm
 
-    neigh_logo = get_logo_image("local_neighshop" if NEIGHSHOP_LOGO_PATH.exists() else NEIGHSHOP_LOGO_URL)
+    neigh_logo = get_logo_image(neighshop_logo_source())
 
     header_height = 50
     header_top = height - margin
@@ -583,23 +900,18 @@ def generate_invoice_pdf(invoice: Dict[str, Any]) -> str:
     else:
         current_y = header_top - 12
 
-    pdf_canvas.setFillColor(colors.HexColor("#0F172A"))
+    pdf_canvas.setFillColor(INVOICE_PRIMARY_COLOR)
     pdf_canvas.setFont("Helvetica-Bold", 18)
     pdf_canvas.drawString(text_x, current_y, "Neighshop Global")
     current_y -= 18
 
     pdf_canvas.setFont("Helvetica", 9)
-    address_lines = wrap_text(
-        "Shri Ram Nagar, 8-B, opp. Dhanwantri Hospital & Research Centre, near New Sanganer Road, Mansarovar, Jaipur, Rajasthan 302020",
-        width=80,
-    )
-    address_lines.append("+91 8307802643")
-    for line in address_lines:
+    for line in COMPANY_ADDRESS_LINES:
         pdf_canvas.drawString(text_x, current_y, line)
         current_y -= 11
 
     y_position = current_y - 6
-    pdf_canvas.setStrokeColor(colors.HexColor("#CBD5F5"))
+    pdf_canvas.setStrokeColor(INVOICE_DIVIDER_COLOR)
     pdf_canvas.line(margin, y_position, width - margin, y_position)
     y_position -= 16
 
@@ -657,62 +969,33 @@ def generate_invoice_pdf(invoice: Dict[str, Any]) -> str:
 
     cost_rows: List[List[str]] = [
         ["Description", "Amount (INR)"],
-        [f"Plan - {invoice.get('plan_name')}", f"{plan_price:,.2f}"],
-        ["One-time Setup Fee", f"{setup_fee_amount:,.2f}"],
+        [f"Plan - {invoice.get('plan_name')}", format_amount(plan_price)],
+        ["One-time Setup Fee", format_amount(setup_fee_amount)],
     ]
     if setup_discount > 0:
-        cost_rows.append(["One-time Discount", f"-{setup_discount:,.2f}"])
+        cost_rows.append(["One-time Discount", f"-{format_amount(setup_discount)}"])
     cost_rows.extend(
         [
-            ["Subtotal", f"{subtotal:,.2f}"],
-            ["Grand Total", f"{total_due:,.2f}"],
+            ["Subtotal", format_amount(subtotal)],
+            ["Grand Total", format_amount(total_due)],
         ]
     )
 
     table = Table(cost_rows, colWidths=[120 * mm, 40 * mm])
-    table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 11),
-                ("ALIGN", (0, 0), (-1, 0), "LEFT"),
-                ("ALIGN", (0, 1), (-1, -1), "RIGHT"),
-                ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 1), (-1, -1), 10),
-                ("LINEABOVE", (0, 1), (-1, -1), 0.25, colors.HexColor("#CBD5F5")),
-                ("LINEBELOW", (0, -1), (-1, -1), 0.8, colors.HexColor("#0F172A")),
-                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
-            ]
-        )
-    )
+    table.setStyle(INVOICE_TABLE_STYLE)
     table_width, table_height = table.wrap(0, 0)
     table.drawOn(pdf_canvas, margin, y_position - table_height)
     y_position = y_position - table_height - 36
 
-    default_payment_lines = [
-        f"Bank Name: {DEFAULT_BANK_ACCOUNT}",
-        f"Account Holder: {DEFAULT_BANK_NAME}",
-        f"Account Number: {DEFAULT_ACCOUNT_NUMBER}",
-        f"UPI: {DEFAULT_UPI_LABEL}",
-    ]
-
-    payment_lines_raw = os.getenv("INVOICE_PAYMENT_LINES")
-    if payment_lines_raw:
-        payment_lines = [line.strip() for line in payment_lines_raw.split("|") if line.strip()]
-    else:
-        payment_lines = default_payment_lines
-
     pdf_canvas.setFont("Helvetica-Bold", 12)
     pdf_canvas.drawString(margin, y_position, "Payment Details")
     pdf_canvas.setFont("Helvetica", 10)
     y_position -= 16
-    for line in payment_lines:
+    for line in INVOICE_PAYMENT_LINES:
         pdf_canvas.drawString(margin, y_position, line)
         y_position -= 14
 
-    qr_image = get_logo_image("https://github.com/AKM-dv/servicemate/blob/main/WhatsApp%20Image%202025-11-07%20at%2001.24.34.jpeg?raw=true")
+    qr_image = get_logo_image(UPI_QR_URL)
     if qr_image:
         qr_size = 100
         qr_x = margin
@@ -739,6 +1022,22 @@ def generate_invoice_pdf(invoice: Dict[str, Any]) -> str:
 
     invoice["generated_at"] = generated_dt
 
+
+def finish_pdf_job(pdf_filename: str, future: Future) -> None:
+    PDF_JOBS.pop(pdf_filename, None)
+    exc = future.exception()
+    if exc is not None and app.logger:
+        app.logger.error("Failed to generate invoice PDF %s: %s", pdf_filename, exc)
+
+
+def submit_invoice_pdf(invoice: Dict[str, Any]) -> str:
+    snapshot = dict(invoice)
+    snapshot["generated_at"] = to_ist_datetime(snapshot.get("generated_at")) or datetime.now(IST)
+    pdf_filename = invoice_pdf_filename(snapshot)
+
+    future = PDF_EXECUTOR.submit(generate_invoice_pdf, snapshot)
+    PDF_JOBS[pdf_filename] = future
+    future.add_done_callback(lambda done: finish_pdf_job(pdf_filename, done))
     return f"/files/invoices/{pdf_filename}"
 
 
@@ -771,9 +1070,12 @@ def serialize_followup_record(entry: Dict[str, Any]) -> Dict[str, Any]:
 
 app = Flask(__name__)
 app.config["JSON_SORT_KEYS"] = False
+app.json = OrjsonProvider(app)
 CORS(app, resources={r"/*": {"origins": "*"}})
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
 
 db.init_app(app)
+app.teardown_appcontext(release_connection)
 
 
 def ensure_admin_pin() -> None:
@@ -789,14 +1091,17 @@ def ensure_admin_pin() -> None:
 
     pin_hash = user.get("pin_hash")
     if not pin_hash or not check_password_hash(pin_hash, admin_pin):
+        pin_hash = generate_password_hash(admin_pin)
         execute(
             "UPDATE users SET pin_hash = %s WHERE id = %s",
-            (generate_password_hash(admin_pin), user["id"]),
+            (pin_hash, user["id"]),
         )
+    ADMIN_PIN_CACHE.update(user_id=user["id"], pin_hash=pin_hash)
 
 
 initialize_schema(app)
 ensure_invoice_pdf_dir()
+init_logos()
 
 
 @app.route("/health", methods=["GET"])
@@ -805,10 +1110,12 @@ def health():
 
 
 def authenticate_pin(pin: str) -> bool:
-    user = execute_dict("SELECT id, pin_hash FROM users LIMIT 1", fetchone=True)
-    if not user or not user.get("pin_hash"):
-        return False
-    return check_password_hash(user["pin_hash"], pin)
+    if not ADMIN_PIN_CACHE:
+        user = execute_dict("SELECT id, pin_hash FROM users LIMIT 1", fetchone=True)
+        if not user or not user.get("pin_hash"):
+            return False
+        ADMIN_PIN_CACHE.update(user_id=user["id"], pin_hash=user["pin_hash"])
+    return check_password_hash(ADMIN_PIN_CACHE["pin_hash"], pin)
 
 
 @app.route("/auth/login", methods=["POST"])
@@ -827,17 +1134,19 @@ def login():
 
 @app.route("/plans", methods=["GET"])
 def list_plans():
-    rows = execute_dict("SELECT id, name, price, features, is_active, sort_order FROM plans WHERE is_active = 1 ORDER BY sort_order ASC", fetchall=True)
+    rows = active_plans()
     if not rows:
         seed_plans()
-        rows = execute_dict(
-            "SELECT id, name, price, features, is_active, sort_order FROM plans WHERE is_active = 1 ORDER BY sort_order ASC",
-            fetchall=True,
-        )
-    for row in rows:
-        row["price"] = parse_decimal(row["price"])
-        row["features"] = json_loads(row.get("features")) or []
-    return jsonify(rows)
+        rows = active_plans()
+    return jsonify([{**row, "features": json_loads(row.get("features")) or []} for row in rows])
+
+
+def active_plans() -> List[Dict[str, Any]]:
+    return sorted((plan for plan in get_plans().values() if plan["is_active"]), key=lambda plan: plan["sort_order"] or 0)
+
+
+def find_basic_plan() -> Optional[Dict[str, Any]]:
+    return next((plan for plan in get_plans(refresh=True).values() if plan["name"].lower() == "basic"), None)
 
 
 @app.route("/plans", methods=["PUT"])
@@ -856,21 +1165,14 @@ def update_plans():
         "Lead Management",
     ]
 
-    basic = execute_dict("SELECT id FROM plans WHERE name = %s LIMIT 1", ("Basic",), fetchone=True)
+    basic = find_basic_plan()
     if not basic:
         seed_plans()
-        basic = execute_dict("SELECT id FROM plans WHERE name = %s LIMIT 1", ("Basic",), fetchone=True)
+        basic = find_basic_plan()
 
-    execute(
-        "UPDATE plans SET name=%s, price=%s, features=%s, is_active=1, sort_order=1 WHERE id=%s",
-        (
-            name,
-            price,
-            json_dumps(features),
-            basic["id"],
-        ),
-    )
-    execute("UPDATE plans SET is_active = 0 WHERE id <> %s", (basic["id"],))
+    with db_cursor() as cursor:
+        activate_plan(cursor, basic["id"], name, price, features)
+    invalidate_plans()
 
     return jsonify({"message": "Plan updated"})
 
@@ -892,42 +1194,45 @@ def list_leads():
             conditions.append(f"l.status IN ({placeholders})")
             params.extend(statuses)
 
-    if search_param:
-        like_pattern = f"%{search_param}%"
-        conditions.append(
-            "(l.name LIKE %s OR l.email LIKE %s OR l.phone LIKE %s OR l.brand_name LIKE %s)"
-        )
-        params.extend([like_pattern, like_pattern, like_pattern, like_pattern])
+    if search_param and len(search_param) < SEARCH_MIN_LENGTH:
+        conditions.append("l.name LIKE %s")
+        params.append(f"{search_param}%")
+    elif search_param:
+        search_terms = fulltext_terms(search_param)
+        if search_terms:
+            conditions.append("MATCH (l.name, l.email, l.phone, l.brand_name) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(search_terms)
+        else:
+            like_pattern = f"{search_param}%"
+            conditions.append(
+                "(l.name LIKE %s OR l.email LIKE %s OR l.phone LIKE %s OR l.brand_name LIKE %s)"
+            )
+            params.extend([like_pattern, like_pattern, like_pattern, like_pattern])
 
     if created_from:
-        conditions.append("DATE(l.created_at) >= %s")
+        conditions.append("l.created_at >= DATE(%s)")
         params.append(created_from)
 
     if created_to:
-        conditions.append("DATE(l.created_at) <= %s")
+        conditions.append("l.created_at < DATE(%s) + INTERVAL 1 DAY")
         params.append(created_to)
 
-    query = (
-        """
+    query = f"""
         SELECT l.id, l.name, l.email, l.phone, l.address, l.brand_name, l.status, l.preferred_plan_id,
-               l.converted_on, l.created_at, l.updated_at, p.name AS preferred_plan_name
+               {sql_iso_datetime("l.converted_on", "converted_on")},
+               {sql_iso_datetime("l.created_at", "created_at")},
+               {sql_iso_datetime("l.updated_at", "updated_at")},
+               p.name AS preferred_plan_name
         FROM leads l
         LEFT JOIN plans p ON p.id = l.preferred_plan_id
         """
-    )
 
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
 
     query += " ORDER BY l.created_at DESC"
 
-    param_tuple = tuple(params)
-    rows = execute_dict(
-        query,
-        param_tuple if param_tuple else None,
-        fetchall=True,
-    )
-    return jsonify([serialize_lead_record(row) for row in rows])
+    return app.json.stream(stream_dict_rows(query, tuple(params)))
 
 
 @app.route("/leads", methods=["POST"])
@@ -939,7 +1244,7 @@ def create_lead():
     if not phone:
         return jsonify({"error": "Phone number required"}), 400
 
-    execute(
+    lead_id = execute(
         """
         INSERT INTO leads (name, email, phone, address, brand_name, status, preferred_plan_id)
         VALUES (%s, %s, %s, %s, %s, %s, %s)
@@ -955,45 +1260,28 @@ def create_lead():
         ),
     )
 
-    lead = execute_dict(
-        "SELECT * FROM leads WHERE phone = %s ORDER BY id DESC LIMIT 1",
-        (phone,),
-        fetchone=True,
-    )
+    lead = execute_dict("SELECT * FROM leads WHERE id = %s", (lead_id,), fetchone=True)
     return jsonify(serialize_lead_record(lead)), 201
 
 
 @app.route("/leads/<int:lead_id>", methods=["GET"])
 def get_lead(lead_id: int):
-    lead = execute_dict(
+    leads, followups, invoices = execute_dict_multi(
         """
         SELECT l.*, p.name AS preferred_plan_name
         FROM leads l
         LEFT JOIN plans p ON p.id = l.preferred_plan_id
-        WHERE l.id = %s
-        """,
-        (lead_id,),
-        fetchone=True,
-    )
-    if not lead:
-        return jsonify({"error": "Lead not found"}), 404
-    lead = serialize_lead_record(lead)
-    followups = execute_dict(
-        """
+        WHERE l.id = %s;
         SELECT id, status, follow_up_date, objective, next_follow_up, future_follow_up_note, note, created_at
-        FROM lead_followups WHERE lead_id = %s ORDER BY created_at DESC
-        """,
-        (lead_id,),
-        fetchall=True,
-    )
-    invoices = execute_dict(
-        """
+        FROM lead_followups WHERE lead_id = %s ORDER BY created_at DESC;
         SELECT id, invoice_number, total, generated_at, pdf_url
         FROM invoices WHERE lead_id = %s ORDER BY generated_at DESC
         """,
-        (lead_id,),
-        fetchall=True,
+        (lead_id, lead_id, lead_id),
     )
+    if not leads:
+        return jsonify({"error": "Lead not found"}), 404
+    lead = serialize_lead_record(leads[0])
     lead.update({
         "followups": [serialize_followup_record(item) for item in followups],
         "invoices": [serialize_invoice_record(item) for item in invoices],
@@ -1004,10 +1292,6 @@ def get_lead(lead_id: int):
 @app.route("/leads/<int:lead_id>", methods=["PUT"])
 def update_lead(lead_id: int):
     payload = request.get_json() or {}
-    lead = execute_dict("SELECT id FROM leads WHERE id = %s", (lead_id,), fetchone=True)
-    if not lead:
-        return jsonify({"error": "Lead not found"}), 404
-
     updates: List[str] = []
     values: List[Any] = []
 
@@ -1049,12 +1333,17 @@ def update_lead(lead_id: int):
         values.append(payload.get("converted_on", date.today()))
 
     if not updates:
+        if not execute("SELECT id FROM leads WHERE id = %s", (lead_id,), fetchone=True):
+            return jsonify({"error": "Lead not found"}), 404
         return jsonify({"error": "Nothing to update"}), 400
 
     values.append(lead_id)
     execute(f"UPDATE leads SET {', '.join(updates)} WHERE id = %s", tuple(values))
 
+    cache.delete(invoice_lead_cache_key(lead_id))
     updated = execute_dict("SELECT * FROM leads WHERE id = %s", (lead_id,), fetchone=True)
+    if not updated:
+        return jsonify({"error": "Lead not found"}), 404
     return jsonify(updated)
 
 
@@ -1074,27 +1363,22 @@ def add_followup(lead_id: int):
     else:
         next_follow_up = next_follow_up or None
 
-    lead = execute_dict("SELECT id FROM leads WHERE id = %s", (lead_id,), fetchone=True)
-    if not lead:
-        return jsonify({"error": "Lead not found"}), 404
-
-    execute(
-        """
-        INSERT INTO lead_followups (
-            lead_id, status, follow_up_date, objective, next_follow_up, future_follow_up_note, note
+    try:
+        followup_id = execute(
+            """
+            INSERT INTO lead_followups (
+                lead_id, status, follow_up_date, objective, next_follow_up, future_follow_up_note, note
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            (lead_id, status, follow_up_date, objective, next_follow_up, future_follow_up_note, note),
         )
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """,
-        (lead_id, status, follow_up_date, objective, next_follow_up, future_follow_up_note, note),
-    )
+    except mysql.connector.IntegrityError as exc:
+        if exc.errno == errorcode.ER_NO_REFERENCED_ROW_2:
+            return jsonify({"error": "Lead not found"}), 404
+        raise
 
-    followup = execute_dict(
-        """
-        SELECT * FROM lead_followups WHERE lead_id = %s ORDER BY id DESC LIMIT 1
-        """,
-        (lead_id,),
-        fetchone=True,
-    )
+    followup = execute_dict("SELECT * FROM lead_followups WHERE id = %s", (followup_id,), fetchone=True)
     return jsonify(followup), 201
 
 
@@ -1131,6 +1415,7 @@ def record_payment(lead_id: int):
 
 
 @app.route("/analytics/summary", methods=["GET"])
+@cache.cached(timeout=ANALYTICS_CACHE_TIMEOUT, key_prefix=ANALYTICS_CACHE_KEY)
 def analytics_summary():
     lead_counts = execute_dict(
         """
@@ -1173,9 +1458,6 @@ def analytics_summary():
         fetchone=True,
     ) or {"overdue_count": 0}
 
-    for entry in monthly_revenue:
-        entry["total"] = parse_decimal(entry["total"])
-
     return jsonify(
         {
             "lead_counts": lead_counts,
@@ -1188,15 +1470,16 @@ def analytics_summary():
 
 @app.route("/feedback", methods=["GET"])
 def list_feedback():
-    rows = execute_dict(
-        """
-        SELECT id, title, body, category, status, created_at, updated_at
+    rows = stream_dict_rows(
+        f"""
+        SELECT id, title, body, category, status,
+               {sql_iso_datetime("created_at", "created_at")},
+               {sql_iso_datetime("updated_at", "updated_at")}
         FROM admin_feedback
-        ORDER BY created_at DESC
-        """,
-        fetchall=True,
+        ORDER BY admin_feedback.created_at DESC
+        """
     )
-    return jsonify([serialize_feedback_record(row) for row in rows])
+    return app.json.stream(rows)
 
 
 @app.route("/feedback", methods=["POST"])
@@ -1212,7 +1495,7 @@ def create_feedback():
     if category not in FEEDBACK_CATEGORIES:
         category = "Suggestion"
 
-    execute(
+    feedback_id = execute(
         """
         INSERT INTO admin_feedback (title, body, category)
         VALUES (%s, %s, %s)
@@ -1220,20 +1503,13 @@ def create_feedback():
         (title, body, category),
     )
 
-    entry = execute_dict(
-        "SELECT * FROM admin_feedback ORDER BY id DESC LIMIT 1",
-        fetchone=True,
-    )
+    entry = execute_dict("SELECT * FROM admin_feedback WHERE id = %s", (feedback_id,), fetchone=True)
     return jsonify(serialize_feedback_record(entry)), 201
 
 
 @app.route("/feedback/<int:feedback_id>", methods=["PUT"])
 def update_feedback(feedback_id: int):
     payload = request.get_json() or {}
-    entry = execute_dict("SELECT id FROM admin_feedback WHERE id = %s", (feedback_id,), fetchone=True)
-    if not entry:
-        return jsonify({"error": "Feedback not found"}), 404
-
     updates: List[str] = []
     values: List[Any] = []
 
@@ -1266,32 +1542,35 @@ def update_feedback(feedback_id: int):
         values.append(status)
 
     if not updates:
+        if not execute("SELECT id FROM admin_feedback WHERE id = %s", (feedback_id,), fetchone=True):
+            return jsonify({"error": "Feedback not found"}), 404
         return jsonify({"error": "Nothing to update"}), 400
 
     values.append(feedback_id)
     execute(f"UPDATE admin_feedback SET {', '.join(updates)} WHERE id = %s", tuple(values))
 
     updated = execute_dict("SELECT * FROM admin_feedback WHERE id = %s", (feedback_id,), fetchone=True)
+    if not updated:
+        return jsonify({"error": "Feedback not found"}), 404
     return jsonify(serialize_feedback_record(updated))
 
 
 @app.route("/invoices", methods=["POST"])
 def create_invoice():
     payload = request.get_json() or {}
-    lead_id = payload.get("lead_id")
-    plan_id = payload.get("plan_id")
+    lead_id = parse_id(payload.get("lead_id"))
+    plan_id = parse_id(payload.get("plan_id"))
     if not lead_id or not plan_id:
         return jsonify({"error": "lead_id and plan_id required"}), 400
 
-    plan = execute_dict("SELECT id, name, price FROM plans WHERE id = %s", (plan_id,), fetchone=True)
-    lead = execute_dict("SELECT id, name, email, brand_name, phone, address FROM leads WHERE id = %s", (lead_id,), fetchone=True)
-    if not plan or not lead:
+    details = fetch_invoice_parties(lead_id, plan_id)
+    if not details:
         return jsonify({"error": "Invalid lead or plan"}), 400
 
     setup_discount_input = payload.get("setup_discount")
-    setup_discount = as_decimal(setup_discount_input if setup_discount_input is not None else 0)
+    setup_discount = as_decimal(setup_discount_input if setup_discount_input is not None else 0).quantize(CENTS)
     if setup_discount < 0:
-        setup_discount = Decimal("0")
+        setup_discount = Decimal("0.00")
 
     setup_fee_amount = DEFAULT_SETUP_FEE
     if setup_discount > setup_fee_amount:
@@ -1299,14 +1578,27 @@ def create_invoice():
 
     setup_fee_net = setup_fee_amount - setup_discount
 
-    plan_price = as_decimal(plan["price"])
-    subtotal = plan_price + setup_fee_net
-    tax = Decimal("0")
+    subtotal = details["plan_price"] + setup_fee_net
+    tax = Decimal("0.00")
     total = subtotal
 
     invoice_number = next_invoice_number()
-
-    execute(
+    pdf_url = f"/files/invoices/{invoice_pdf_filename({'invoice_number': invoice_number})}"
+
+    invoice = {
+        **details,
+        "invoice_number": invoice_number,
+        "subtotal": subtotal,
+        "tax": tax,
+        "total": total,
+        "setup_fee_amount": setup_fee_amount,
+        "setup_fee_discount": setup_discount,
+        "setup_fee_net": setup_fee_net,
+        "notes": payload.get("notes"),
+        "pdf_url": pdf_url,
+        "items": [],
+    }
+    invoice["id"] = execute(
         """
         INSERT INTO invoices (
             lead_id,
@@ -1318,50 +1610,77 @@ def create_invoice():
             notes,
             setup_fee_amount,
             setup_fee_discount,
-            setup_fee_net
+            setup_fee_net,
+            pdf_url
         )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """,
         (
-            lead_id,
-            plan_id,
+            invoice["lead_id"],
+            invoice["plan_id"],
             invoice_number,
             subtotal,
             tax,
             total,
-            payload.get("notes"),
+            invoice["notes"],
             setup_fee_amount,
             setup_discount,
             setup_fee_net,
+            pdf_url,
         ),
     )
+    invoice["generated_at"] = execute(
+        "SELECT generated_at FROM invoices WHERE id = %s", (invoice["id"],), fetchone=True
+    )[0]
 
-    invoice_details = fetch_invoice_details(invoice_number)
-    if not invoice_details:
-        return jsonify({"error": "Failed to create invoice"}), 500
+    submit_invoice_pdf(invoice)
+    return jsonify(serialize_invoice_record(invoice)), 201
 
-    invoice_details["plan_price"] = plan_price
-    pdf_url = generate_invoice_pdf(invoice_details)
-    execute(
-        "UPDATE invoices SET pdf_url = %s WHERE invoice_number = %s",
-        (pdf_url, invoice_number),
-    )
-    invoice_details["pdf_url"] = pdf_url
 
-    response_payload = serialize_invoice_record(invoice_details)
-    return jsonify(response_payload), 201
+def invoice_lead_cache_key(lead_id: Any) -> str:
+    return f"invoice_lead_v1:{lead_id}"
 
 
-def next_invoice_number() -> str:
-    today = datetime.utcnow()
-    prefix = today.strftime("INV%Y%m")
-    seq_row = execute(
-        "SELECT COUNT(*) FROM invoices WHERE invoice_number LIKE %s",
-        (f"{prefix}%",),
+def fetch_invoice_parties(lead_id: Any, plan_id: Any) -> Optional[Dict[str, Any]]:
+    lead_key = invoice_lead_cache_key(lead_id)
+    lead = cache.get(lead_key)
+    if lead is not None:
+        plan = execute_dict(
+            "SELECT id AS plan_id, name AS plan_name, price AS plan_price FROM plans WHERE id = %s",
+            (plan_id,),
+            fetchone=True,
+        )
+        return {**plan, **lead} if plan else None
+
+    row = execute_dict(
+        """
+        SELECT p.id AS plan_id, p.name AS plan_name, p.price AS plan_price,
+               l.id AS lead_id, l.name AS lead_name, l.email AS lead_email, l.phone AS lead_phone,
+               l.address AS lead_address, l.brand_name
+        FROM plans p
+        JOIN leads l ON l.id = %s
+        WHERE p.id = %s
+        """,
+        (lead_id, plan_id),
         fetchone=True,
     )
-    seq = (seq_row[0] if seq_row else 0) + 1
-    return f"{prefix}{seq:04d}"
+    if not row:
+        return None
+    lead = {key: value for key, value in row.items() if not key.startswith("plan_")}
+    cache.set(lead_key, lead, timeout=INVOICE_LOOKUP_CACHE_TIMEOUT)
+    return row
+
+
+def next_invoice_number() -> str:
+    period = datetime.utcnow().strftime("%Y%m")
+    seq = execute(
+        """
+        INSERT INTO invoice_sequences (period, seq) VALUES (%s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE seq = LAST_INSERT_ID(seq + 1)
+        """,
+        (period,),
+    )
+    return f"INV{period}{seq:04d}"
 
 
 @app.route("/invoices", methods=["GET"])
@@ -1371,54 +1690,66 @@ def list_invoices():
     generated_to = request.args.get("generated_to")
 
     conditions: List[str] = []
-    params: List[Any] = []
-
-    if search_param:
-        like_pattern = f"%{search_param}%"
-        conditions.append(
-            "(i.invoice_number LIKE %s OR l.name LIKE %s OR l.email LIKE %s OR l.phone LIKE %s)"
-        )
-        params.extend([like_pattern, like_pattern, like_pattern, like_pattern])
+    params: List[Any] = [request.host_url.rstrip("/")]
+
+    if search_param and len(search_param) < SEARCH_MIN_LENGTH:
+        conditions.append("l.name LIKE %s")
+        params.append(f"{search_param}%")
+    elif search_param:
+        like_pattern = f"{search_param}%"
+        search_terms = fulltext_terms(search_param)
+        if search_terms:
+            conditions.append(
+                "(i.invoice_number LIKE %s OR MATCH (l.name, l.email, l.phone, l.brand_name) AGAINST (%s IN BOOLEAN MODE))"
+            )
+            params.extend([like_pattern, search_terms])
+        else:
+            conditions.append(
+                "(i.invoice_number LIKE %s OR l.name LIKE %s OR l.email LIKE %s OR l.phone LIKE %s OR l.brand_name LIKE %s)"
+            )
+            params.extend([like_pattern] * 5)
 
     if generated_from:
-        conditions.append("DATE(i.generated_at) >= %s")
+        conditions.append("i.generated_at >= DATE(%s)")
         params.append(generated_from)
 
     if generated_to:
-        conditions.append("DATE(i.generated_at) <= %s")
+        conditions.append("i.generated_at < DATE(%s) + INTERVAL 1 DAY")
         params.append(generated_to)
 
-    query = (
-        """
-        SELECT i.id, i.invoice_number, i.total, i.generated_at, i.pdf_url,
-               i.setup_fee_amount, i.setup_fee_discount, i.setup_fee_net,
-               i.subtotal, i.tax,
+    query = f"""
+        SELECT i.id, i.invoice_number, CAST(i.total AS CHAR) AS total,
+               {sql_iso_datetime("i.generated_at", "generated_at")},
+               {sql_invoice_url("i.pdf_url", "pdf_url")},
+               CAST(i.setup_fee_amount AS CHAR) AS setup_fee_amount,
+               CAST(i.setup_fee_discount AS CHAR) AS setup_fee_discount,
+               CAST(i.setup_fee_net AS CHAR) AS setup_fee_net,
+               CAST(i.subtotal AS CHAR) AS subtotal, CAST(i.tax AS CHAR) AS tax,
                l.name AS lead_name, l.email AS lead_email, l.phone AS lead_phone,
-               p.name AS plan_name, p.price AS plan_price
+               p.name AS plan_name, CAST(p.price AS CHAR) AS plan_price,
+               NULL AS created_at, NULL AS updated_at
         FROM invoices i
         JOIN leads l ON l.id = i.lead_id
         JOIN plans p ON p.id = i.plan_id
         """
-    )
 
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
 
     query += " ORDER BY i.generated_at DESC"
 
-    param_tuple = tuple(params)
-    invoices = execute_dict(
-        query,
-        param_tuple if param_tuple else None,
-        fetchall=True,
-    )
-    serialized = [serialize_invoice_record(entry) for entry in invoices]
-    return jsonify(serialized)
+    return app.json.stream(stream_dict_rows(query, tuple(params)))
 
 
 @app.route("/files/invoices/<path:filename>")
 def serve_invoice_pdf(filename: str):
     download_flag = request.args.get("download", "0") == "1"
+    pending = PDF_JOBS.get(filename)
+    if pending is not None:
+        try:
+            pending.result(timeout=PDF_JOB_TIMEOUT)
+        except Exception:
+            pass
     return send_from_directory(INVOICE_PDF_DIR, filename, as_attachment=download_flag)
 
 
@@ -29,7 +29,10 @@ CREATE TABLE IF NOT EXISTS leads (
     converted_on DATE DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    FOREIGN KEY (preferred_plan_id) REFERENCES plans(id)
+    FOREIGN KEY (preferred_plan_id) REFERENCES plans(id),
+    INDEX idx_leads_status_created (status, created_at DESC),
+    INDEX idx_leads_plan_status (preferred_plan_id, status),
+    FULLTEXT INDEX ft_leads_search (name, email, phone, brand_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 CREATE TABLE IF NOT EXISTS lead_followups (
@@ -42,7 +45,8 @@ CREATE TABLE IF NOT EXISTS lead_followups (
     future_follow_up_note TEXT,
     note TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE
+    FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE,
+    INDEX idx_followups_lead_created (lead_id, created_at DESC)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 CREATE TABLE IF NOT EXISTS invoices (
@@ -60,7 +64,8 @@ CREATE TABLE IF NOT EXISTS invoices (
     notes TEXT,
     pdf_url VARCHAR(255) DEFAULT NULL,
     FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE,
-    FOREIGN KEY (plan_id) REFERENCES plans(id)
+    FOREIGN KEY (plan_id) REFERENCES plans(id),
+    INDEX idx_invoices_lead_generated (lead_id, generated_at DESC)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 CREATE TABLE IF NOT EXISTS invoice_items (
@@ -83,7 +88,13 @@ CREATE TABLE IF NOT EXISTS lead_payments (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (lead_id) REFERENCES leads(id) ON DELETE CASCADE,
     FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE SET NULL,
-    UNIQUE KEY lead_month_unique (lead_id, billing_month)
+    UNIQUE KEY lead_month_unique (lead_id, billing_month),
+    INDEX idx_payments_paid (paid_on, billing_month)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS invoice_sequences (
+    period CHAR(6) PRIMARY KEY,
+    seq INT NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 CREATE TABLE IF NOT EXISTS admin_feedback (